@@ -1,6 +1,13 @@
 #!/usr/bin/env python
+import asyncio
+import atexit
+import bisect
 import csv
+import ctypes
+import fcntl
 import os
+import select
+import shlex
 import shutil
 import signal
 import subprocess
@@ -17,6 +24,8 @@ TEMPERATURE_CURVE = [(0, 0),
                      (60, 50),
                      (80, 80),
                      (90, 100)]
+SHUTDOWN_SIGNALS = {signal.SIGINT, signal.SIGTERM}
+SPEED_LUT_MAX = 150  # Highest integer temperature the lookup table covers; readings are clamped to it
 LOOP_DELAY = 3
 DEBUG = int(os.environ.get("SFC_DEBUG", "0"))
 
@@ -36,58 +45,309 @@ IPMI_SDR_FAN_TYPE = "fan"
 IPMI_SDR_FULL_CSV_KEYS = ["name", "value", "unit", "status", "entity_id", "entity_name", "type", "nominal", "minimum",
                           "maximum", "unr", "uc", "unc", "lnr", "lc", "lnc", "unknown_1", "unknown_2"]
 IPMI_SDR_CONCISE_CSV_KEYS = ["name", "value", "unit", "status"]
+# Column indices for split rows; ipmitool's -c output is never quoted so plain str.split is enough
+IPMI_SDR_CSV_VALUE_IDX = 1
+IPMI_SDR_CSV_STATUS_IDX = 3
 
-IPMI_GET_ZONE_SPEED = "0x30 0x70 0x66 0x00 0x{zone:02x}"
-IPMI_SET_ZONE_SPEED = "0x30 0x70 0x66 0x01 0x{zone:02x} 0x{speed:02x}"
-IPMI_GET_FAN_PRESET = "0x30 0x45 0x00"
-IPMI_SET_FAN_PRESET = "0x30 0x45 0x01 0x{preset:02}"
+HWMON_PATH = "/sys/class/hwmon"
+HWMON_CPU_DRIVERS = ("coretemp", "k10temp")  # CPU temperature drivers preferred over IPMI readings
+
+IPMI_NETFN_SENSOR = 0x04
+IPMI_CMD_GET_SENSOR_READING = 0x2D
+IPMI_CMD_GET_SENSOR_FACTORS = 0x23
+
+IPMI_NETFN_SUPERMICRO = 0x30
+IPMI_CMD_ZONE_SPEED = 0x70  # data: 0x66, 0x00 (get) / 0x01 (set), zone, [speed]
+IPMI_CMD_FAN_PRESET = 0x45  # data: 0x00 (get) or 0x01, preset (set)
+
+# Kernel IPMI character device interface (linux/ipmi.h)
+IPMI_DEV_PATH = "/dev/ipmi0"
+IPMI_DEV_TIMEOUT = 5.0
+IPMI_BMC_CHANNEL = 0x0f
+IPMI_SYSTEM_INTERFACE_ADDR_TYPE = 0x0c
+IPMI_MAX_MSG_LENGTH = 272
+IPMI_RESPONSE_RECV_TYPE = 1
+IPMI_IOC_MAGIC = ord('i')
+
+
+class IpmiMsg(ctypes.Structure):
+    _fields_ = [("netfn", ctypes.c_ubyte),
+                ("cmd", ctypes.c_ubyte),
+                ("data_len", ctypes.c_ushort),
+                ("data", ctypes.POINTER(ctypes.c_ubyte))]
+
+
+class IpmiReq(ctypes.Structure):
+    _fields_ = [("addr", ctypes.c_void_p),
+                ("addr_len", ctypes.c_uint),
+                ("msgid", ctypes.c_long),
+                ("msg", IpmiMsg)]
+
+
+class IpmiRecv(ctypes.Structure):
+    _fields_ = [("recv_type", ctypes.c_int),
+                ("addr", ctypes.c_void_p),
+                ("addr_len", ctypes.c_uint),
+                ("msgid", ctypes.c_long),
+                ("msg", IpmiMsg)]
+
+
+class IpmiSystemInterfaceAddr(ctypes.Structure):
+    _fields_ = [("addr_type", ctypes.c_int),
+                ("channel", ctypes.c_short),
+                ("lun", ctypes.c_ubyte)]
+
+
+def _ioc(direction, nr, size):
+    return (direction << 30) | (size << 16) | (IPMI_IOC_MAGIC << 8) | nr
+
+
+IPMICTL_SEND_COMMAND = _ioc(2, 13, ctypes.sizeof(IpmiReq))  # _IOR('i', 13, struct ipmi_req)
+IPMICTL_RECEIVE_MSG_TRUNC = _ioc(3, 11, ctypes.sizeof(IpmiRecv))  # _IOWR('i', 11, struct ipmi_recv)
+
+IPMI_SHELL_PROMPT = "ipmitool> "
+IPMI_SHELL_SENTINEL = "__END__"  # Unknown command echoed back by the shell, used to delimit responses
+IPMI_SHELL_ERROR_PREFIXES = ("Invalid command", "Unable to", "Error")
+
+# %-templates with the 'raw' prefix baked in; a single-int % substitution is much cheaper
+# than str.format keyword parsing, and most substitutions happen once at startup anyway
+IPMI_GET_ZONE_SPEED = "raw 0x30 0x70 0x66 0x00 0x%02x"  # % zone
+IPMI_SET_ZONE_SPEED = "raw 0x30 0x70 0x66 0x01 0x%02x 0x%02x"  # % (zone, speed)
+IPMI_GET_FAN_PRESET = "raw 0x30 0x45 0x00"
+IPMI_SET_FAN_PRESET = "raw 0x30 0x45 0x01 0x%02x"  # % preset
+
+_ipmi_shell: subprocess.Popen  # Persistent ipmitool shell session, started in __main__
+_ipmi_dev_fd = -1  # /dev/ipmi0 descriptor; -1 means raw commands go through ipmitool instead
+_ipmi_msgid = 0
+
+_hwmon_reader = None  # SensorReader over the tempN_input files, constructed at startup
+
+CPU_SENSOR_IDS: list[int] = []  # Resolved at startup when /dev/ipmi0 is available
+CPU_SENSOR_FACTORS: list[tuple[int, int, int, int]] = []  # (m, b, b_exp, r_exp) per sensor
 
 
 def generate_curve_coefficients(input_coords):
+    # Returns sorted breakpoint upper bounds and parallel slope/intercept arrays for bisection.
+    # This and target_fan_speed only run once at startup to build the speed lookup table,
+    # so they stay plain Python rather than a compiled extension
+
     curve: list[tuple[int, int]] = sorted(input_coords, key=lambda x: x[0])
     previous = curve.pop(0)
-    temperature_funcs: dict[int, tuple[int, int]] = {}
+    xs: list[int] = []
+    ms: list[float] = []
+    bs: list[float] = []
     for coord in curve:
         x_coords, y_coords = zip(previous, coord)
         m = (y_coords[1] - y_coords[0]) / (x_coords[1] - x_coords[0])
         b = y_coords[0] - (m * x_coords[0])
-        temperature_funcs.update({coord[0]: (m, b)})
+        xs.append(coord[0])
+        ms.append(m)
+        bs.append(b)
         previous = coord
-    return temperature_funcs
+    return xs, ms, bs
+
 
+def target_fan_speed(curve: tuple[list[int], list[float], list[float]], temperature: int) -> int:
+    xs, ms, bs = curve
+    i = bisect.bisect_left(xs, temperature)
+    if i == len(xs):
+        return 100
+    return int(ms[i] * temperature + bs[i])
 
-def target_fan_speed(curve: dict[int, tuple[int, int]], temperature: int) -> int:
-    # This requires python 3.6+ for insertion-ordered dict entries
-    for segment in curve.items():
-        if temperature <= segment[0]:
-            return int(segment[1][0] * temperature + segment[1][1])
-    return 100
+
+def ipmi_dev_open():
+    # Talking to the BMC through the kernel device turns each raw command into an ioctl pair,
+    # skipping ipmitool startup entirely; sensor (sdr) commands still go through ipmitool
+    global _ipmi_dev_fd
+    try:
+        _ipmi_dev_fd = os.open(IPMI_DEV_PATH, os.O_RDWR)
+        return True
+    except OSError as e:
+        print(f"Warning: could not open {IPMI_DEV_PATH} ({e.strerror}),"
+              f" raw commands will go through ipmitool", file=sys.stderr)
+        return False
+
+
+def ipmi_raw(netfn: int, cmd: int, data: bytes):
+    # Send one raw command over /dev/ipmi0; returns the response data (sans completion code) or False
+    global _ipmi_msgid
+    _ipmi_msgid += 1
+    addr = IpmiSystemInterfaceAddr(IPMI_SYSTEM_INTERFACE_ADDR_TYPE, IPMI_BMC_CHANNEL, 0)
+    req_data = (ctypes.c_ubyte * len(data))(*data)
+    req = IpmiReq(ctypes.cast(ctypes.pointer(addr), ctypes.c_void_p), ctypes.sizeof(addr),
+                  _ipmi_msgid, IpmiMsg(netfn, cmd, len(data), req_data))
+    recv_buf = (ctypes.c_ubyte * IPMI_MAX_MSG_LENGTH)()
+    recv_addr = IpmiSystemInterfaceAddr()
+    recv = IpmiRecv(0, ctypes.cast(ctypes.pointer(recv_addr), ctypes.c_void_p), ctypes.sizeof(recv_addr),
+                    0, IpmiMsg(0, 0, IPMI_MAX_MSG_LENGTH, recv_buf))
+    try:
+        fcntl.ioctl(_ipmi_dev_fd, IPMICTL_SEND_COMMAND, req)
+        deadline = time.monotonic() + IPMI_DEV_TIMEOUT
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([_ipmi_dev_fd], [], [], remaining)[0]:
+                print(f"Error: timed out waiting for IPMI response to 0x{netfn:02x}/0x{cmd:02x}", file=sys.stderr)
+                return False
+            recv.msg.data_len = IPMI_MAX_MSG_LENGTH  # Restore the capacity a previous receive overwrote
+            fcntl.ioctl(_ipmi_dev_fd, IPMICTL_RECEIVE_MSG_TRUNC, recv)
+            if recv.recv_type == IPMI_RESPONSE_RECV_TYPE and recv.msgid == _ipmi_msgid:
+                break
+            # Not our response (e.g. the late reply to an earlier timed-out command); discard it
+    except OSError as e:
+        print(f"Error: IPMI ioctl failed: {e.strerror}", file=sys.stderr)
+        return False
+
+    resp = bytes(recv_buf[:recv.msg.data_len])
+    if not resp or resp[0] != 0:
+        cc = f"0x{resp[0]:02x}" if resp else "missing"
+        print(f"Error: IPMI command 0x{netfn:02x}/0x{cmd:02x} failed (completion code {cc})", file=sys.stderr)
+        return False
+    return resp[1:]
+
+
+def ipmi_shell_start():
+    # Keeping one ipmitool child alive across iterations avoids paying fork+exec
+    # and interface (KCS) setup for every command, which dominates each tick
+    global _ipmi_shell
+    _ipmi_shell = subprocess.Popen(["ipmitool", "shell"], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, encoding='ascii', bufsize=1)
+
+
+def ipmi_shell_read():
+    # Collect output lines until the sentinel echoes back; returns None on EOF (dead child)
+    lines = []
+    while True:
+        line = _ipmi_shell.stdout.readline()
+        if not line:
+            return None
+        while line.startswith(IPMI_SHELL_PROMPT):  # The prompt has no newline, so it prefixes output lines
+            line = line[len(IPMI_SHELL_PROMPT):]
+        if IPMI_SHELL_SENTINEL in line:
+            return lines
+        line = line.strip()
+        if line:
+            lines.append(line)
+
+
+def ipmi_shell_run(cmd_text: str):
+    # Send one or more newline-separated commands, returning the response lines or None on shell failure
+    for _attempt in range(2):
+        try:
+            _ipmi_shell.stdin.write(f"{cmd_text}\n{IPMI_SHELL_SENTINEL}\n")
+            _ipmi_shell.stdin.flush()
+            lines = ipmi_shell_read()
+        except OSError:
+            lines = None
+        if lines is not None:
+            return lines
+        # Watchdog: the shell died (EOF/broken pipe), restart it and retry once
+        _ipmi_shell.kill()
+        _ipmi_shell.wait()
+        ipmi_shell_start()
+    print(" Error: ipmitool shell keeps dying, falling back to one-shot invocation", file=sys.stderr)
+    return None
 
 
 def ipmi_cmd(raw_cmd: str):
+    # The shell only matches plain commands against its command table and never produces CSV
+    # output, so anything carrying global options (-c etc.) must run as a one-shot invocation
+    if not raw_cmd.startswith("raw "):
+        return ipmi_cmd_oneshot(raw_cmd)
+
+    if DEBUG:
+        timer = time.time()
+    lines = ipmi_shell_run(raw_cmd)
+    if lines is None:
+        return ipmi_cmd_oneshot(raw_cmd)
+
+    out = "\n".join(lines)
+    failed = any(line.startswith(IPMI_SHELL_ERROR_PREFIXES) for line in lines)
+    if failed:
+        print(" Error: Problem running ipmitool", file=sys.stderr)
+        print(f" Command: {raw_cmd}", file=sys.stderr)
+        print(f" Output: {out}", file=sys.stderr)
+        return False
+    elif DEBUG:
+        print(f" Command: {raw_cmd}", file=sys.stderr)
+        print(f" Output: {out}", file=sys.stderr)
+        # noinspection PyUnboundLocalVariable
+        print(f" Time Elapsed: {time.time() - timer}")
+
+    if out:
+        return out
+    else:
+        return True
+
+
+def ipmi_cmd_batch(raw_cmds: list[str]):
+    # Issue several commands in a single shell round trip; only success is reported, output is not parsed
     if DEBUG:
         timer = time.time()
-    s = subprocess.run(f"ipmitool {raw_cmd} 2>&1", shell=True, capture_output=True, encoding='ascii')
+    lines = ipmi_shell_run("\n".join(raw_cmds))
+    if lines is None:
+        return ipmi_cmd_oneshot_parallel(raw_cmds)
+
+    if any(line.startswith(IPMI_SHELL_ERROR_PREFIXES) for line in lines):
+        print(" Error: Problem running ipmitool", file=sys.stderr)
+        print(f" Commands: {raw_cmds}", file=sys.stderr)
+        print(f" Output: {lines}", file=sys.stderr)
+        return False
+    elif DEBUG:
+        print(f" Commands: {raw_cmds}", file=sys.stderr)
+        print(f" Output: {lines}", file=sys.stderr)
+        # noinspection PyUnboundLocalVariable
+        print(f" Time Elapsed: {time.time() - timer}")
+    return True
+
+
+def ipmi_cmd_oneshot(raw_cmd: str):
+    if DEBUG:
+        timer = time.time()
+    # argv invocation skips the /bin/sh intermediary; merged stderr matches the old "2>&1"
+    s = subprocess.run(["ipmitool", *shlex.split(raw_cmd)],
+                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT, encoding='ascii')
+    out: str = s.stdout.strip()
     if s.returncode != 0:
         print(" Error: Problem running ipmitool", file=sys.stderr)
         print(f" Command: ipmitool {raw_cmd}", file=sys.stderr)
         print(f" Return code: {s.returncode}", file=sys.stderr)
-        print(f" Output: {s.stdout.strip()}", file=sys.stderr)
+        print(f" Output: {out}", file=sys.stderr)
         return False
     elif DEBUG:
         print(f" Command: ipmitool {raw_cmd}", file=sys.stderr)
         print(f" Return code: {s.returncode}", file=sys.stderr)
-        print(f" Output: {s.stdout.strip()}", file=sys.stderr)
+        print(f" Output: {out}", file=sys.stderr)
         # noinspection PyUnboundLocalVariable
         print(f" Time Elapsed: {time.time() - timer}")
 
-    out: str = s.stdout.strip()
     if out:
         return out
     else:
         return True
 
 
+async def ipmi_cmd_oneshot_async(raw_cmd: str):
+    proc = await asyncio.create_subprocess_exec("ipmitool", *shlex.split(raw_cmd),
+                                                stdout=asyncio.subprocess.PIPE,
+                                                stderr=asyncio.subprocess.STDOUT)
+    out, _ = await proc.communicate()
+    if proc.returncode != 0:
+        print(" Error: Problem running ipmitool", file=sys.stderr)
+        print(f" Command: ipmitool {raw_cmd}", file=sys.stderr)
+        print(f" Return code: {proc.returncode}", file=sys.stderr)
+        print(f" Output: {out.decode('ascii').strip()}", file=sys.stderr)
+        return False
+    return True
+
+
+def ipmi_cmd_oneshot_parallel(raw_cmds: list[str]):
+    # Run the one-shot invocations concurrently so one stalled zone command doesn't delay the rest
+    async def run_all():
+        return await asyncio.gather(*(ipmi_cmd_oneshot_async(raw_cmd) for raw_cmd in raw_cmds))
+
+    return all(asyncio.run(run_all()))
+
+
 def ipmi_sdr_sensors_from_type(sensor_type: str):
     # This isn't used for temperature because IPMITool fetches all the sensors individually, which can be very slow
     csv_data = ipmi_cmd(f"-c sdr type {sensor_type}")
@@ -104,32 +364,151 @@ def ipmi_sdr_sensors_from_name(sensors: list[str]):
     if csv_data is False:
         return False
 
-    data = csv.reader(csv_data.splitlines())
-    return [dict(zip(IPMI_SDR_FULL_CSV_KEYS, sensor_data)) for sensor_data in data]
+    return [line.split(",") for line in csv_data.splitlines()]
+
+
+def discover_temp_sensors():
+    # Discovery walks every temperature SDR record, so it runs exactly once at startup;
+    # the loop afterwards only issues targeted 'sdr get' reads for the discovered names
+    for _attempt in range(2):
+        sensors = ipmi_sdr_sensors_from_type(IPMI_SDR_TEMP_TYPE)
+        if sensors is not False:
+            names = [sensor["name"] for sensor in sensors
+                     if sensor["name"].startswith(IPMI_SDR_TEMP_SENSOR_FILTER)]
+            if names:
+                return names
+        print("Warning: temperature sensor discovery found no matching sensors, retrying", file=sys.stderr)
+    print("Error: could not discover any matching temperature sensors", file=sys.stderr)
+    sys.exit(1)
+
+
+class SensorReader:
+    # Holds sensor files open across iterations so each read is a single pread,
+    # not an open+read+close triple per sensor per tick
+    def __init__(self, paths: list[str]):
+        self.fds = [os.open(path, os.O_RDONLY) for path in paths]
+        atexit.register(self.close)
+
+    def read(self, _pread=os.pread) -> list[int]:
+        # _pread is bound at definition time to skip the os module lookup per sensor per tick
+        return [int(_pread(fd, 16, 0).split(b"\n", 1)[0]) for fd in self.fds]
+
+    def close(self):
+        for fd in self.fds:
+            os.close(fd)
+        self.fds = []
+
+
+def hwmon_open_temps():
+    # CPU temps from hwmon cost a microsecond file read instead of BMC traffic; the
+    # descriptors are opened once and reread with pread so the scan never repeats
+    global _hwmon_reader
+    paths = []
+    try:
+        for hwmon in sorted(os.listdir(HWMON_PATH)):
+            base = os.path.join(HWMON_PATH, hwmon)
+            try:
+                with open(os.path.join(base, "name")) as f:
+                    if f.read().strip() not in HWMON_CPU_DRIVERS:
+                        continue
+            except OSError:
+                continue
+            paths.extend(sorted(os.path.join(base, entry) for entry in os.listdir(base)
+                                if entry.startswith("temp") and entry.endswith("_input")))
+    except OSError:
+        return False
+    if not paths:
+        return False
+    _hwmon_reader = SensorReader(paths)
+    print(f"Using hwmon temperature inputs: {paths}")
+    return True
+
+
+def discover_sensor_numbers(names: list[str]):
+    # One 'sdr elist' walk maps each name to its SDR sensor number, so the loop can issue
+    # Get Sensor Reading directly instead of having ipmitool re-locate the record every tick
+    csv_data = ipmi_cmd("-c sdr elist")
+    if csv_data is False:
+        return False
+    numbers = {}
+    for line in csv_data.splitlines():
+        row = line.split(",")
+        if len(row) < 2:
+            continue
+        sensor_id = row[1].strip()
+        if row[0] in names and sensor_id.endswith("h"):
+            numbers[row[0]] = int(sensor_id[:-1], 16)
+    if any(name not in numbers for name in names):
+        return False
+    return [numbers[name] for name in names]
+
+
+def twos_complement(value: int, bits: int) -> int:
+    return value - (1 << bits) if value & (1 << (bits - 1)) else value
+
+
+def sensor_reading_factors(sensor_number: int):
+    # Get Sensor Reading Factors (IPMI spec 35.5): reading degC = (m * raw + b * 10^b_exp) * 10^r_exp
+    res = ipmi_raw(IPMI_NETFN_SENSOR, IPMI_CMD_GET_SENSOR_FACTORS, bytes([sensor_number, 0]))
+    if res is False or len(res) < 7:
+        return False
+    m = twos_complement(((res[2] & 0xc0) << 2) | res[1], 10)
+    b = twos_complement(((res[4] & 0xc0) << 2) | res[3], 10)
+    r_exp = twos_complement(res[6] >> 4, 4)
+    b_exp = twos_complement(res[6] & 0x0f, 4)
+    return m, b, b_exp, r_exp
+
+
+def get_sensor_reading(sensor_number: int):
+    # Returns the raw reading byte, None if the sensor reports unavailable, or False on failure
+    res = ipmi_raw(IPMI_NETFN_SENSOR, IPMI_CMD_GET_SENSOR_READING, bytes([sensor_number]))
+    if res is False or len(res) < 2:
+        return False
+    if res[1] & 0x20:  # Reading/state unavailable
+        return None
+    return res[0]
 
 
 def get_system_temps(sensors: list[str]):
-    data: list[dict] = ipmi_sdr_sensors_from_name(sensors)
-    if data is False:
+    if _hwmon_reader is not None:
+        return [millidegrees // 1000 for millidegrees in _hwmon_reader.read()]
+
+    if _ipmi_dev_fd >= 0 and CPU_SENSOR_IDS:
+        temps = []
+        for number, (m, b, b_exp, r_exp) in zip(CPU_SENSOR_IDS, CPU_SENSOR_FACTORS):
+            raw = get_sensor_reading(number)
+            if raw is False:
+                print("Error: unable to get current system temperatures", file=sys.stderr)
+                return False
+            if raw is None:
+                continue
+            temps.append(int((m * raw + b * 10 ** b_exp) * 10 ** r_exp))
+        return temps if temps else False
+
+    rows: list[list[str]] = ipmi_sdr_sensors_from_name(sensors)
+    if rows is False:
         print("Error: unable to get current system temperatures", file=sys.stderr)
         return False
-    temps: map = map(lambda sensor: int(sensor["value"]),
-                     filter(lambda sensor: sensor["status"] != "ns", data))
-    return list(temps)
+    return [int(row[IPMI_SDR_CSV_VALUE_IDX]) for row in rows if row[IPMI_SDR_CSV_STATUS_IDX] != "ns"]
 
 
 def get_fan_rpms():
-    fan_sensors: list[dict] = ipmi_sdr_sensors_from_type(IPMI_SDR_FAN_TYPE)
-    if fan_sensors is False:
+    csv_data = ipmi_cmd(f"-c sdr type {IPMI_SDR_FAN_TYPE}")
+    if csv_data is False:
         print("Error: unable to get current fan RPMs", file=sys.stderr)
         return False
-    fan_rpms: map = map(lambda sensor: int(sensor["value"]),
-                        filter(lambda sensor: sensor["status"] != "ns", fan_sensors))
-    return list(fan_rpms)
+    rows = [line.split(",") for line in csv_data.splitlines()]
+    return [int(row[IPMI_SDR_CSV_VALUE_IDX]) for row in rows if row[IPMI_SDR_CSV_STATUS_IDX] != "ns"]
 
 
 def get_fan_preset():
-    res = ipmi_cmd("raw " + IPMI_GET_FAN_PRESET)
+    if _ipmi_dev_fd >= 0:
+        res = ipmi_raw(IPMI_NETFN_SUPERMICRO, IPMI_CMD_FAN_PRESET, b"\x00")
+        if res is False:
+            print("Error: could not get current fan preset", file=sys.stderr)
+            return False
+        return res[0]
+    res = ipmi_cmd(IPMI_GET_FAN_PRESET)
     if res is False:
         print("Error: could not get current fan preset", file=sys.stderr)
         return False
@@ -140,7 +519,11 @@ def set_fan_preset(preset: int):
     if preset not in FAN_PRESETS_STR:
         print("Warning: setting fan preset to unknown preset", file=sys.stderr)
 
-    if ipmi_cmd("raw " + IPMI_SET_FAN_PRESET.format(preset=preset)):
+    if _ipmi_dev_fd >= 0:
+        ok = ipmi_raw(IPMI_NETFN_SUPERMICRO, IPMI_CMD_FAN_PRESET, bytes([0x01, preset])) is not False
+    else:
+        ok = ipmi_cmd(IPMI_SET_FAN_PRESET % preset) is not False
+    if ok:
         print("Updated preset to " + FAN_PRESETS_STR.get(preset, "unknown"))
         return True
     else:
@@ -148,9 +531,8 @@ def set_fan_preset(preset: int):
         return False
 
 
-def check_preset_full(set_to_full: bool = False):
-    preset: int = get_fan_preset()
-
+def check_preset_full(preset: int, set_to_full: bool = False):
+    # Takes the preset read at startup rather than issuing a second get for the same value
     if preset != FAN_PRESET_FULL:
         if set_to_full:
             set_fan_preset(FAN_PRESET_FULL)
@@ -160,7 +542,13 @@ def check_preset_full(set_to_full: bool = False):
 
 # noinspection PyDefaultArgument
 def get_zone_speed(fan_zone: int):
-    speed = ipmi_cmd("raw " + IPMI_GET_ZONE_SPEED.format(zone=fan_zone))
+    if _ipmi_dev_fd >= 0:
+        res = ipmi_raw(IPMI_NETFN_SUPERMICRO, IPMI_CMD_ZONE_SPEED, bytes([0x66, 0x00, fan_zone]))
+        if res is False:
+            print(f"Error: unable to get zone {fan_zone} speed")
+            return False
+        return res[0]
+    speed = ipmi_cmd(IPMI_GET_ZONE_SPEED % fan_zone)
     if speed is False:
         print(f"Error: unable to get zone {fan_zone} speed")
         return False
@@ -168,13 +556,18 @@ def get_zone_speed(fan_zone: int):
 
 
 # noinspection PyDefaultArgument
-def set_zone_speed(fan_zone: int, speed: int):
-    if ipmi_cmd("raw " + IPMI_SET_ZONE_SPEED.format(zone=fan_zone, speed=speed)):
+def set_zone_speed(zone_idx: int, target_speed: int):
+    # target_speed is the pre-offset curve output; the zone offset and clamp are baked into the tables
+    if _ipmi_dev_fd >= 0:
+        ok = ipmi_raw(IPMI_NETFN_SUPERMICRO, IPMI_CMD_ZONE_SPEED, ZONE_RAW[zone_idx][target_speed]) is not False
+    else:
+        ok = ipmi_cmd(ZONE_CMDS[zone_idx][target_speed]) is not False
+    if ok:
         if DEBUG:
-            print(f"Set fans on zone {fan_zone} to {speed:02}%")
+            print(ZONE_SET_MSGS[zone_idx] % target_speed)
         return True
     else:
-        print(f"Error: Unable to update fan zone {fan_zone}", file=sys.stderr)
+        print(ZONE_ERR_MSGS[zone_idx], file=sys.stderr)
         return False
 
 
@@ -186,20 +579,37 @@ def quit_and_reset_preset(*_signal_args, clean: bool = True):
     exit(0 if clean else 1)
 
 
-def main_loop(temp_sensors: list[str], temperature_curve: dict[int, tuple[int, int]]):
-    time.sleep(LOOP_DELAY)
+_last_temp = None
+_last_speed = None
+
+
+def main_loop(temp_sensors: list[str], speed_lut: list[int]):
+    global _last_temp, _last_speed
 
     temps = get_system_temps(temp_sensors)
     if temps is False:
         raise IOError("Could not get system temperatures")
+    temp = max(temps)
     if DEBUG:
-        print(f"Got temperature {max(temps)}")
+        print(f"Got temperature {temp}")
+
+    # Steady-state ticks are the common case; skip the curve and all BMC writes when nothing changed
+    if temp == _last_temp:
+        return
+    _last_temp = temp
 
-    target_speed = target_fan_speed(temperature_curve, max(temps))
+    target_speed = speed_lut[min(max(temp, 0), SPEED_LUT_MAX)]
+    if target_speed == _last_speed:
+        return
 
-    for zone, offset in zip(FAN_ZONES, FAN_ZONE_OFFSETS):
-        if set_zone_speed(zone, max(min(target_speed + offset, 100), 0)) is False:
-            raise IOError("Could not set fan speed")
+    if _ipmi_dev_fd >= 0:
+        ok = all([ipmi_raw(IPMI_NETFN_SUPERMICRO, IPMI_CMD_ZONE_SPEED, zone_raw[target_speed]) is not False
+                  for zone_raw in ZONE_RAW])
+    else:
+        ok = ipmi_cmd_batch([zone_cmds[target_speed] for zone_cmds in ZONE_CMDS])
+    if ok is False:
+        raise IOError("Could not set fan speed")
+    _last_speed = target_speed
 
 
 if __name__ == '__main__':
@@ -210,28 +620,66 @@ if __name__ == '__main__':
         print("Warning: ipmitool access requires root;"
               " you may see misleading 'No such file or directory' errors", file=sys.stderr)
 
+    ipmi_dev_open()
+    ipmi_shell_start()
+
     EXIT_PRESET = get_fan_preset()
     EXIT_PRESET = FAN_PRESET_OPTIMAL if EXIT_PRESET is False else EXIT_PRESET  # Set fallback to optimal
 
     temp_curve = generate_curve_coefficients(TEMPERATURE_CURVE)
-
-    sdr_temp_sensors = list(filter(lambda name: name.startswith(IPMI_SDR_TEMP_SENSOR_FILTER),
-                                   map(lambda sensor: sensor["name"], ipmi_sdr_sensors_from_type(IPMI_SDR_TEMP_TYPE))))
-    print(f"Using IPMI temperature sensors: {sdr_temp_sensors}")
-
-    # noinspection PyTypeChecker
-    signal.signal(signal.SIGINT, quit_and_reset_preset)
-    # noinspection PyTypeChecker
-    signal.signal(signal.SIGTERM, quit_and_reset_preset)
+    # Sensors report integer degrees C, so the whole curve collapses to an integer lookup table
+    speed_lut = [target_fan_speed(temp_curve, t) for t in range(SPEED_LUT_MAX + 1)]
+
+    # Fully formatted set-speed command per zone per curve output, so the hot path is just a list index;
+    # ZONE_RAW holds the equivalent data bytes for the /dev/ipmi0 path
+    ZONE_CMDS = [[IPMI_SET_ZONE_SPEED % (zone, max(min(speed + offset, 100), 0))
+                  for speed in range(101)]
+                 for zone, offset in zip(FAN_ZONES, FAN_ZONE_OFFSETS)]
+    ZONE_RAW = [[bytes([0x66, 0x01, zone, max(min(speed + offset, 100), 0)])
+                 for speed in range(101)]
+                for zone, offset in zip(FAN_ZONES, FAN_ZONE_OFFSETS)]
+    # Message strings with the constant zone part pre-rendered, only the speed is substituted
+    ZONE_SET_MSGS = [f"Set fans on zone {zone} to %02d%%" for zone in FAN_ZONES]
+    ZONE_ERR_MSGS = [f"Error: Unable to update fan zone {zone}" for zone in FAN_ZONES]
+
+    sdr_temp_sensors = []
+    if not hwmon_open_temps():
+        # No usable hwmon CPU driver; fall back to reading temperatures over IPMI
+        sdr_temp_sensors = discover_temp_sensors()
+        print(f"Using IPMI temperature sensors: {sdr_temp_sensors}")
+
+    if sdr_temp_sensors and _ipmi_dev_fd >= 0:
+        # Resolve sensor numbers and conversion factors once; each tick then costs one
+        # Get Sensor Reading per sensor instead of an SDR repository walk
+        sensor_numbers = discover_sensor_numbers(sdr_temp_sensors)
+        if sensor_numbers is not False:
+            sensor_factors = [sensor_reading_factors(number) for number in sensor_numbers]
+            if all(factors is not False for factors in sensor_factors):
+                CPU_SENSOR_IDS = sensor_numbers
+                CPU_SENSOR_FACTORS = sensor_factors
+        if not CPU_SENSOR_IDS:
+            print("Warning: could not resolve sensor numbers, temperatures will use 'sdr get'", file=sys.stderr)
+
+    # Shutdown signals are blocked and consumed by sigtimedwait below, which doubles as the
+    # tick delay: the kernel wakes us exactly on timeout or immediately on SIGINT/SIGTERM
+    signal.pthread_sigmask(signal.SIG_BLOCK, SHUTDOWN_SIGNALS)
 
     # noinspection PyBroadException
     try:
-        check_preset_full(True)
+        check_preset_full(EXIT_PRESET, True)
+        # Schedule ticks on the monotonic clock so the period is LOOP_DELAY exactly,
+        # not LOOP_DELAY plus however long the tick's work took
+        next_tick = time.monotonic()
         while True:
             # noinspection PyTypeChecker
-            main_loop(sdr_temp_sensors, temp_curve)
-    except KeyboardInterrupt:
-        quit_and_reset_preset()
+            main_loop(sdr_temp_sensors, speed_lut)
+            next_tick += LOOP_DELAY
+            now = time.monotonic()
+            if next_tick < now - LOOP_DELAY:
+                # Stalled by more than a full period; reset the schedule instead of playing catch-up
+                next_tick = now + LOOP_DELAY
+            if signal.sigtimedwait(SHUTDOWN_SIGNALS, max(next_tick - now, 0)) is not None:
+                quit_and_reset_preset()
     except Exception as e:
         print(traceback.format_exc(), file=sys.stderr)
         # If original_preset wasn't set, no changes were made and the program can crash without consequence